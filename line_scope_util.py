@@ -49,6 +49,34 @@ def get_line(start_l, end_l, start_r, end_r, height, width):
     return line_left,line_right
 
 
+def get_points_in_scope(points, line_left, line_right):
+    """Check whether pixel points are between the left and right line, all points at once.
+
+    Args:
+        points: Pixel coordinates of points, array likes [[x,y] ,..., [x,y]].
+        line_left: Col value of the left line in each row, zero if the line doesn't reach the row.
+        line_right: Col value of the right line in each row, zero if the line doesn't reach the row.
+
+    Returns:
+        in_scope: Bool array, whether each point is between the two lines.
+        margin: Float array, the distance (pixels) in the same row from each point to the nearer line. It is positive
+            between the lines, negative outside and nan if the lines don't reach the row of the point.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    line_left = np.asarray(line_left, dtype=np.float64)
+    line_right = np.asarray(line_right, dtype=np.float64)
+    valid = np.isfinite(points).all(axis=1) & (points[:, 1] >= 0) & (points[:, 1] < line_left.shape[0])
+    rows = np.where(valid, points[:, 1], 0).astype(np.int64)
+    # A line which doesn't reach the row while the other one does is out of the frame
+    left = np.where(line_left[rows] == 0, -np.inf, line_left[rows])
+    right = np.where(line_right[rows] == 0, np.inf, line_right[rows])
+    reached = valid & (np.isfinite(left) | np.isfinite(right))
+    margin = np.minimum(points[:, 0] - left, right - points[:, 0])
+    margin[~reached] = np.nan
+    in_scope = reached & (margin >= 0)
+    return in_scope, margin
+
+
 def check_line_correctness(line_left,line_right):
     """ To check if two lines' pixel are correct.
 
@@ -101,7 +129,49 @@ def get_curve(curve_left, curve_right, height, width, bottom_y, curve_point_coun
     """
     line_left = get_curve_scope(np.delete(curve_left, 2, axis = 0)[:, 0:curve_point_count_left], height, width)
     line_right = get_curve_scope(np.delete(curve_right, 2, axis = 0)[:, 0:curve_point_count_right], height, width)
+    return trim_curve_scope(line_left, line_right, height, width, bottom_y, cross_t)
+
 
+def get_curve_by_conic(curve_left, curve_right, height, width, bottom_y, sub_pixel=False, cross_t = 2):
+    """ Obtain the coordinates of continuous pixel points by the col values solved from the image conic
+
+    Args:
+        curve_left: Float col value of the left curve in each row, nan if the curve doesn't reach the row.
+        curve_right: Float col value of the right curve in each row, nan if the curve doesn't reach the row.
+        height: Height of the frame resolution.
+        width: Width of the frame resolution.
+        bottom_y: The bottom boundary of curves.
+        sub_pixel: Whether to keep float col values instead of rounding them.
+        cross_t: The threshold at which two lines intersect on the same row.
+
+    Returns:
+         line_left, line_right: Two lists whose size are the height of the frame.
+                The i-th value is the col value of the pixel of left/right line in the i-th row. If the i-th value is zero,
+                it means that the line doesn't reach the i-th row.
+    """
+    line_left = np.where(np.isnan(curve_left), 0, curve_left)
+    line_right = np.where(np.isnan(curve_right), 0, curve_right)
+    if not sub_pixel:
+        line_left = np.rint(line_left).astype(np.int64)
+        line_right = np.rint(line_right).astype(np.int64)
+    return trim_curve_scope(line_left, line_right, height, width, bottom_y, cross_t)
+
+
+def trim_curve_scope(line_left, line_right, height, width, bottom_y, cross_t = 2):
+    """ Remove the pixels below bottom_y and above the intersection of two curves, and fill the rows where only one
+    curve is out of the frame.
+
+    Args:
+        line_left: Col value of the left curve in each row, zero if the curve doesn't reach the row.
+        line_right: Col value of the right curve in each row, zero if the curve doesn't reach the row.
+        height: Height of the frame resolution.
+        width: Width of the frame resolution.
+        bottom_y: The bottom boundary of curves.
+        cross_t: The threshold at which two lines intersect on the same row.
+
+    Returns:
+         line_left, line_right
+    """
     cross_mark = False
     i = height -2
     while i >= 0:
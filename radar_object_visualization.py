@@ -1,4 +1,4 @@
-from yaml_reader import CameraParam
+from yaml_reader import CameraParam, MultiCameraParam
 import cv2
 import pandas as pd
 import numpy as np
@@ -47,7 +47,83 @@ def draw_objects_per_frame(frame, obj_pixel_pos, obj_info):
     return frame
 
 
-def draw_radar_objects_on_video(video_path, radar_object_path, yaml_path, save_path):
+# Only these columns of the radar objects csv are used
+RADAR_OBJECT_DTYPES = {'sec': np.int32, 'fps': np.int32, 'obj_id': np.int32,
+                       'obj_x': np.float32, 'obj_y': np.float32, 'obj_z': np.float32}
+
+
+def read_radar_objects_by_frame(radar_object_path, chunk_size=100000):
+    """ Read the radar objects csv chunk by chunk and group the rows by frame, so that the memory usage doesn't depend
+    on the length of the log. The csv must be sorted by second and frame index.
+
+    Args:
+        radar_object_path: Radar objects csv path.
+        chunk_size: Number of rows read at a time.
+
+    Yields:
+        (second, frame_index), objects_frame: objects_frame is a DataFrame containing all radar objects of the frame.
+
+    Raises:
+        ValueError: If the csv is not sorted, e.g. rows of one frame are not adjacent.
+    """
+    last_key = None
+
+    def check_order(key):
+        if last_key is not None and key <= last_key:
+            raise ValueError('Radar objects csv is not sorted by sec and fps: (sec, fps) %s follows %s' %
+                             (key, last_key))
+        return key
+
+    pending = None
+    for chunk in pd.read_csv(radar_object_path, usecols=list(RADAR_OBJECT_DTYPES), dtype=RADAR_OBJECT_DTYPES,
+                             chunksize=chunk_size):
+        if pending is not None:
+            chunk = pd.concat((pending, chunk), ignore_index=True)
+        sec = chunk['sec'].values
+        fps = chunk['fps'].values
+        starts = np.concatenate(([0], np.flatnonzero((sec[1:] != sec[:-1]) | (fps[1:] != fps[:-1])) + 1))
+        for start, end in zip(starts[:-1], starts[1:]):
+            last_key = check_order((int(sec[start]), int(fps[start])))
+            yield last_key, chunk.iloc[start:end]
+        # The last frame of this chunk may continue in the next chunk
+        pending = chunk.iloc[starts[-1]:]
+    if pending is not None and len(pending) > 0:
+        last_key = check_order((int(pending['sec'].values[0]), int(pending['fps'].values[0])))
+        yield last_key, pending
+
+
+class RadarObjectStream:
+    """This class is used for getting radar objects frame by frame in step with the video.
+        The csv must be sorted by second and frame index, otherwise ValueError is raised while reading.
+        How to use: An example:
+            radar_objects = RadarObjectStream(radar_object_path)
+            objects_frame = radar_objects.get_objects(second, frame_index)
+    Attributes:
+        frames: Generator of (second, frame_index), objects_frame.
+        next_frame: The next (second, frame_index), objects_frame which is not consumed, None if the csv ends.
+    """
+    def __init__(self, radar_object_path, chunk_size=100000):
+        self.frames = read_radar_objects_by_frame(radar_object_path, chunk_size)
+        self.next_frame = next(self.frames, None)
+
+    def get_objects(self, second, frame_index):
+        """Get radar objects of the frame. Frames before it which are not requested are dropped.
+
+        Args:
+            second: Second of the frame, starting from 1.
+            frame_index: Frame index in the second, starting from 1.
+
+        Returns:
+            A DataFrame of radar objects, or None if there is no object in the frame.
+        """
+        while self.next_frame is not None and self.next_frame[0] < (second, frame_index):
+            self.next_frame = next(self.frames, None)
+        if self.next_frame is not None and self.next_frame[0] == (second, frame_index):
+            return self.next_frame[1]
+        return None
+
+
+def draw_radar_objects_on_video(video_path, radar_object_path, yaml_path, save_path, camera_name='roof_cam_2'):
     """Draw all radar objects info on videos.
 
     Args:
@@ -55,6 +131,7 @@ def draw_radar_objects_on_video(video_path, radar_object_path, yaml_path, save_p
         radar_object_path: Radar objects csv path.
         yaml_path: Camera yaml configure file path.
         save_path: Outpue video save path
+        camera_name: Name of the camera in the yaml file.
 
     """
     vc = cv2.VideoCapture(video_path)
@@ -62,38 +139,90 @@ def draw_radar_objects_on_video(video_path, radar_object_path, yaml_path, save_p
     size = (int(vc.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vc.get(cv2.CAP_PROP_FRAME_HEIGHT)))
     fourcc = cv2.VideoWriter_fourcc(*'XVID')
 
-    radar_objects = pd.read_csv(radar_object_path)
-    camera_con = CameraParam(yaml_path)
+    radar_objects = RadarObjectStream(radar_object_path)
+    camera_con = CameraParam(yaml_path, camera_name)
     output_video = cv2.VideoWriter(save_path, fourcc, fps, size)
 
     rval = vc.isOpened()
     frame_index = 0
     second = 1
-    objects_second = radar_objects[radar_objects['sec'] == second]
     while rval:
-        frame_index = frame_index + 1
         rval, frame = vc.read()
-        objects_frame = objects_second[objects_second['fps'] == frame_index]
-        if objects_frame is None or len(objects_frame)==0:
-            continue
-        obj_vec_pos = objects_frame[['obj_x','obj_y','obj_z']].values
-        obj_vec_pos = np.vstack((obj_vec_pos.T, np.ones(obj_vec_pos.shape[0])))
-        obj_pixel_pos = np.dot(camera_con.transform_veh2image_matrix, obj_vec_pos)
-        obj_pixel_pos[0] = np.divide(obj_pixel_pos[0], obj_pixel_pos[2])
-        obj_pixel_pos[1] = np.divide(obj_pixel_pos[1], obj_pixel_pos[2])
-        # [[x,y]...[x,y]]
-        obj_pixel_pos = np.delete(obj_pixel_pos.T, 2, axis=1)
-        frame = draw_objects_per_frame(frame, obj_pixel_pos, objects_frame[['obj_id','obj_x','obj_y','obj_z']].values)
+        if not rval:
+            break
+        frame_index = frame_index + 1
+        objects_frame = radar_objects.get_objects(second, frame_index)
+        if objects_frame is not None:
+            obj_vec_pos = objects_frame[['obj_x','obj_y','obj_z']].values
+            obj_vec_pos = np.vstack((obj_vec_pos.T, np.ones(obj_vec_pos.shape[0])))
+            obj_pixel_pos = np.dot(camera_con.transform_veh2image_matrix, obj_vec_pos)
+            obj_pixel_pos[0] = np.divide(obj_pixel_pos[0], obj_pixel_pos[2])
+            obj_pixel_pos[1] = np.divide(obj_pixel_pos[1], obj_pixel_pos[2])
+            # [[x,y]...[x,y]]
+            obj_pixel_pos = np.delete(obj_pixel_pos.T, 2, axis=1)
+            frame = draw_objects_per_frame(frame, obj_pixel_pos,
+                                           objects_frame[['obj_id','obj_x','obj_y','obj_z']].values)
         output_video.write(frame)
         if frame_index % fps == 0:
             second+=1
             frame_index = 0
-            objects_second = radar_objects[radar_objects['sec'] == second]
 
     vc.release()
     output_video.release()
 
 
+def draw_radar_objects_on_videos(video_paths, radar_object_path, yaml_path, save_paths, camera_names):
+    """Draw all radar objects info on the videos of several cameras. The radar objects csv is read once, and objects of
+    each frame are projected to all cameras by one matmul. Videos are supposed to be synchronized.
+
+    Args:
+        video_paths: Video file paths, one for each camera.
+        radar_object_path: Radar objects csv path.
+        yaml_path: Camera yaml configure file path.
+        save_paths: Outpue video save paths, one for each camera.
+        camera_names: Names of the cameras in the yaml file, in the same order of video_paths.
+
+    """
+    vcs = [cv2.VideoCapture(video_path) for video_path in video_paths]
+    fps = vcs[0].get(cv2.CAP_PROP_FPS)
+    fourcc = cv2.VideoWriter_fourcc(*'XVID')
+    output_videos = [cv2.VideoWriter(save_path, fourcc, vc.get(cv2.CAP_PROP_FPS),
+                                     (int(vc.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vc.get(cv2.CAP_PROP_FRAME_HEIGHT))))
+                     for vc, save_path in zip(vcs, save_paths)]
+
+    radar_objects = RadarObjectStream(radar_object_path)
+    multi_camera_con = MultiCameraParam(yaml_path, camera_names)
+
+    frame_index = 0
+    second = 1
+    while True:
+        frames = [vc.read()[1] for vc in vcs]
+        if any(frame is None for frame in frames):
+            break
+        frame_index = frame_index + 1
+        objects_frame = radar_objects.get_objects(second, frame_index)
+        if objects_frame is not None:
+            obj_vec_pos = objects_frame[['obj_x','obj_y','obj_z']].values
+            obj_vec_pos = np.vstack((obj_vec_pos.T, np.ones(obj_vec_pos.shape[0])))
+            # Cx3xn
+            obj_pixel_pos = multi_camera_con.project(obj_vec_pos)
+            obj_info = objects_frame[['obj_id','obj_x','obj_y','obj_z']].values
+            for i in range(len(frames)):
+                # Objects behind the camera are not shown
+                in_front = obj_pixel_pos[i][2] > 0
+                frames[i] = draw_objects_per_frame(frames[i], obj_pixel_pos[i][:2, in_front].T, obj_info[in_front])
+        for output_video, frame in zip(output_videos, frames):
+            output_video.write(frame)
+        if frame_index % fps == 0:
+            second+=1
+            frame_index = 0
+
+    for vc in vcs:
+        vc.release()
+    for output_video in output_videos:
+        output_video.release()
+
+
 if __name__ == '__main__':
     basic_path = '/Users/oumingfeng/Documents/lab/HW/data/'
     video_path = basic_path +'1561343763996000.mp4'
@@ -1,13 +1,17 @@
 import cv2
 import numpy as np
 import math
-from yaml_reader import BaseParam
+from yaml_reader import BaseParam, MultiBaseParam, project_points
 from ransac_line import fit_line_by_ransac
-from line_scope_util import get_line,get_curve
+from line_scope_util import get_line,get_curve,get_curve_by_conic,get_curve_scope
 from parse_args import parse_args
+from video_reader import VideoReader
 LEFT = 1
 RIGHT = -1
 MID = 0
+# Methods for generating the curved track lines
+SAMPLING = 'sampling'
+CONIC = 'conic'
 
 
 class NewTrackLineGenerator:
@@ -23,6 +27,11 @@ class NewTrackLineGenerator:
         line_color: (B,G,R) color, the line color of track lines on the frame when testing
         curve_point_color: (B,G,R) color, the points color of track lines on the frame when testing
         x_end: The furthest distance of the point on track in the real world.
+        curve_method: SAMPLING or CONIC. SAMPLING projects scattered points on the trajectory and joins them with a
+            polyline, CONIC solves the image conic of the trajectory circle row by row.
+        sub_pixel: Only used by CONIC. Whether to return float col values instead of rounded int col values.
+        pixel_tolerance: Only used by SAMPLING. Max distance (pixels) between the projected track line and the polyline
+            joining the projected samples.
     """
     def __init__(self, base_param):
         self.base_param = base_param
@@ -31,6 +40,9 @@ class NewTrackLineGenerator:
         self.line_color = (0, 255, 0)
         self.curve_point_color = (0, 0, 255)
         self.x_end = 100
+        self.curve_method = SAMPLING
+        self.sub_pixel = False
+        self.pixel_tolerance = 0.5
 
     def add_track_line(self, steer_angle, frame=None):
         """Used for getting the coordinates of each pixel on track lines
@@ -52,72 +64,121 @@ class NewTrackLineGenerator:
         x_end = self.x_end
         y_range = self.base_param.tread / 2.0
         z_pos = self.base_param.head_height
-        point_num = int(x_end) - int(x_start)
-        # Returns num evenly spaced samples, calculated over the interval [x_start, x_end]
-        line_world_y = np.linspace(x_start, x_end, point_num)
-        line_world_left_x = np.ones(point_num)
-        line_world_right_x = np.ones(point_num)
-        curve_point_count_left = 0
-        curve_point_count_right = 0
-
-        # Calculate track line point's x in real world if the steer angle is non-zero
-        # In this version, steer_angle is always 0
+
         self.steer_angle = self.steer_angle_rectify(steer_angle)
+        if self.dir != MID and self.curve_method == CONIC:
+            curve_pixel_left, curve_pixel_right, line_bottom_y = self.get_track_line_by_conic(x_start, x_end, y_range,
+                                                                                               z_pos, self.base_param)
+        else:
+            line_left, line_right = self.get_track_line_world_points(x_start, x_end, z_pos, self.base_param.tf_matrix)
+
+            # Transform left and right line real world coordinates to pixel coordinates on frame by transform matrix
+            # in calibration which ignores camera distortion. [x,y,z,1]
+            line_pixel_left = np.dot(self.base_param.tf_matrix, line_left)
+            line_pixel_left[0] = np.divide(line_pixel_left[0], line_pixel_left[2])
+            line_pixel_left[1] = np.divide(line_pixel_left[1], line_pixel_left[2])
+            line_pixel_right = np.dot(self.base_param.tf_matrix, line_right)
+            line_pixel_right[0] = np.divide(line_pixel_right[0], line_pixel_right[2])
+            line_pixel_right[1] = np.divide(line_pixel_right[1], line_pixel_right[2])
+            curve_pixel_left, curve_pixel_right, line_bottom_y, line_ends = self.get_track_line_pixels(
+                line_pixel_left, line_pixel_right, self.base_param)
+
+        # This part is used for testing convenience
+        if frame is not None:
+            # for i in range(int(self.base_param.screen_h)-1):
+            #     cv2.circle(frame,(int(line_pixel_left[0][i]), int(line_pixel_left[1][i])),radius=3, color=(0,0,255),thickness=-1)
+            #     cv2.circle(frame,(int(line_pixel_right[0][i]), int(line_pixel_right[1][i])),radius=3, color=(0,0,255),thickness=-1)
+            if self.dir == MID:
+                cross_p, line_left_bottom_p, line_right_bottom_p = line_ends
+                cv2.line(frame, (int(cross_p[0]), int(cross_p[1])),
+                         (line_left_bottom_p[0], line_left_bottom_p[1]), color=self.line_color, thickness=2)
+                cv2.line(frame, (int(cross_p[0]), int(cross_p[1])),
+                         (line_right_bottom_p[0], line_right_bottom_p[1]), color=self.line_color, thickness=2)
+            else:
+                # for i in range(len(line_pixel_right[0])):
+                #     if i < curve_point_count_right :
+                #         cv2.circle(frame, (int(line_pixel_right[0][i]), int(line_pixel_right[1][i])), radius=2, color=self.curve_point_color, thickness=-1)
+                #     if i < curve_point_count_left :
+                #         cv2.circle(frame,  (int(line_pixel_left[0][i]), int(line_pixel_left[1][i])), radius=2, color=self.curve_point_color , thickness=-1)
+                self.draw_curve(frame, curve_pixel_left, curve_pixel_right, line_bottom_y)
+            cv2.imwrite('/Users/oumingfeng/Documents/lab/HW/world_to_image/test.jpg', frame)
+
+        return curve_pixel_left, curve_pixel_right
+
+    def get_track_line_by_conic(self, x_start, x_end, y_range, z_pos, base_param):
+        """Used for getting the coordinates of each pixel on curved track lines by their image conics. The cost of this
+        method only depends on the frame height.
+
+        Args:
+            x_start: X coordinate of the nearest point on the line in vehicle coordinate system.
+            x_end: X coordinate of the furthest point on the line in vehicle coordinate system.
+            y_range: Half of the distance between left and right line.
+            z_pos: Z coordinate of the line in vehicle coordinate system.
+            base_param: BaseParam of the camera.
+
+        Returns:
+            curve_pixel_left, curve_pixel_right: The same as add_track_line().
+            line_bottom_y: Row index of the bottom end of lines.
+        """
+        line_bottom_y = self.get_line_bottom_y(x_start, y_range, z_pos, base_param)
+        curve_pixel_left, curve_pixel_right = get_curve_by_conic(
+            self.get_curve_pixel_by_conic(self.get_trajectory_r2(LEFT), x_start, x_end, z_pos, base_param),
+            self.get_curve_pixel_by_conic(self.get_trajectory_r2(RIGHT), x_start, x_end, z_pos, base_param),
+            base_param.screen_h, base_param.screen_w, line_bottom_y, self.sub_pixel)
+        return curve_pixel_left, curve_pixel_right, line_bottom_y
+
+    def get_track_line_world_points(self, x_start, x_end, z_pos, tf_matrix):
+        """Sample the left and right line in real world, so that the projected polyline is close enough to the line.
+
+        Args:
+            x_start: X coordinate of the nearest point on the line in vehicle coordinate system.
+            x_end: X coordinate of the furthest point on the line in vehicle coordinate system.
+            z_pos: Z coordinate of the line in vehicle coordinate system.
+            tf_matrix: Transform matrix whose shape is 3x4, or stacked transform matrices whose shape is Cx3x4. The
+                samples are dense enough for all cameras.
+
+        Returns:
+            line_left, line_right: Homogeneous coordinates [x,y,z,1] of the points, ndarray whose shape is 4xn.
+        """
         if self.dir != MID:
-            length = line_world_y.shape[0]
-            left_end_mark = False
-            right_end_mark = False
-            for i in range(length):
-                try:
-                    if not left_end_mark:
-                        line_world_left_x[i] = self.get_line_left_x_real_world(line_world_y[i])
-                        curve_point_count_left += 1
-                except ValueError:
-                    # This exception will happen when line_world_y[i] exceeds the largest y on the trajectory.And the remain
-                    # line_world_y is keep its' default value 1, and these points would be filtered in get_curve() by the
-                    # boundary bottom_y.
-                    # print("value error")
-                    left_end_mark = True
-                    pass
-                try:
-                    if not right_end_mark :
-                        line_world_right_x[i] = self.get_line_right_x_real_world(line_world_y[i])
-                        curve_point_count_right += 1
-                except ValueError:
-                    # This exception will happen when line_world_y[i] exceeds the largest y on the trajectory.And the remain
-                    # line_world_y is keep its' default value 1, and these points would be filtered in get_curve() by the
-                    # boundary bottom_y.
-                    # print("value error")
-                    right_end_mark = True
-                    pass
+            line_left = self.get_curve_world_points(LEFT, x_start, x_end, z_pos, tf_matrix)
+            line_right = self.get_curve_world_points(RIGHT, x_start, x_end, z_pos, tf_matrix)
         else:
-            line_world_left_x = y_range * line_world_left_x
-            line_world_right_x = (-y_range) * line_world_right_x
-
-        # Transform left and right line real world coordinates to pixel coordinates on frame by transform matrix in
-        # calibration which ignores camera distortion. [x,y,z,1]
-        line_left = np.stack((line_world_y, line_world_left_x, z_pos * np.ones(point_num), np.ones(point_num)), 0)
-        line_pixel_left = np.dot(self.base_param.tf_matrix, line_left)
-        line_pixel_left[0] = np.divide(line_pixel_left[0], line_pixel_left[2])
-        line_pixel_left[1] = np.divide(line_pixel_left[1], line_pixel_left[2])
-        line_right = np.stack((line_world_y, line_world_right_x, z_pos * np.ones(point_num), np.ones(point_num)), 0)
-        line_pixel_right = np.dot(self.base_param.tf_matrix, line_right)
-        line_pixel_right[0] = np.divide(line_pixel_right[0], line_pixel_right[2])
-        line_pixel_right[1] = np.divide(line_pixel_right[1], line_pixel_right[2])
+            line_left = self.get_straight_world_points(LEFT, x_start, x_end, z_pos, tf_matrix)
+            line_right = self.get_straight_world_points(RIGHT, x_start, x_end, z_pos, tf_matrix)
+        return line_left, line_right
+
+    def get_track_line_pixels(self, line_pixel_left, line_pixel_right, base_param):
+        """Used for getting the coordinates of each pixel on track lines from the projected samples.
+
+        Args:
+            line_pixel_left: Projected samples on the left line, ndarray whose shape is 3xn. The rows are pixel x,
+                pixel y and depth.
+            line_pixel_right: Projected samples on the right line, ndarray whose shape is 3xn.
+            base_param: BaseParam of the camera.
+
+        Returns:
+            curve_pixel_left, curve_pixel_right: The same as add_track_line().
+            line_bottom_y: Row index of the bottom end of lines.
+            line_ends: [cross_p, line_left_bottom_p, line_right_bottom_p] of straight lines, None for curves.
+        """
+        curve_point_count_left = line_pixel_left.shape[1]
+        curve_point_count_right = line_pixel_right.shape[1]
         # Get the pixel coordinate of the end of line, which is closed to the bottom of the frame.
         line_bottom_y = int(line_pixel_left[1][0])
-        if line_bottom_y > self.base_param.screen_h:
-            line_bottom_y = self.base_param.screen_h - 2
+        if line_bottom_y > base_param.screen_h:
+            line_bottom_y = base_param.screen_h - 2
 
+        line_ends = None
         if self.dir == MID:
             # Using ransac algorithm to fit the line
             aL, bL = fit_line_by_ransac(line_pixel_left, sigma=3)
-            line_pixel_left_y = np.arange(0, int(self.base_param.screen_h) - 1, 1)
+            line_pixel_left_y = np.arange(0, int(base_param.screen_h) - 1, 1)
             line_pixel_left_x = line_pixel_left_y * aL + bL
             # print(aL, bL)
             line_pixel_left = np.stack((line_pixel_left_x, line_pixel_left_y), 0)
             aR, bR = fit_line_by_ransac(line_pixel_right, sigma=3)
-            line_pixel_right_y = np.arange(0, int(self.base_param.screen_h) - 1, 1)
+            line_pixel_right_y = np.arange(0, int(base_param.screen_h) - 1, 1)
             line_pixel_right_x = line_pixel_right_y * aR + bR
             # print(aR, bR)
             line_pixel_right = np.stack((line_pixel_right_x, line_pixel_right_y), 0)
@@ -128,70 +189,207 @@ class NewTrackLineGenerator:
             line_right_bottom_p = [int(line_pixel_right[0][line_bottom_y]), int(line_pixel_right[1][line_bottom_y])]
             curve_pixel_left, curve_pixel_right = get_line(tuple(line_left_bottom_p),tuple(cross_p),
                                                            tuple(cross_p), tuple(line_right_bottom_p),
-                                                           self.base_param.screen_h, self.base_param.screen_w )
+                                                           base_param.screen_h, base_param.screen_w )
+            line_ends = [cross_p, line_left_bottom_p, line_right_bottom_p]
         else:
             curve_pixel_left, curve_pixel_right = get_curve(line_pixel_left, line_pixel_right,
-                                                            self.base_param.screen_h, self.base_param.screen_w ,
+                                                            base_param.screen_h, base_param.screen_w ,
                                                             line_bottom_y, curve_point_count_left, curve_point_count_right)
+        return curve_pixel_left, curve_pixel_right, line_bottom_y, line_ends
 
-        # This part is used for testing convenience
-        if frame is not None:
-            # for i in range(int(self.base_param.screen_h)-1):
-            #     cv2.circle(frame,(int(line_pixel_left[0][i]), int(line_pixel_left[1][i])),radius=3, color=(0,0,255),thickness=-1)
-            #     cv2.circle(frame,(int(line_pixel_right[0][i]), int(line_pixel_right[1][i])),radius=3, color=(0,0,255),thickness=-1)
-            if self.dir == MID:
-                cv2.line(frame, (int(cross_p[0]), int(cross_p[1])),
-                         (line_left_bottom_p[0], line_left_bottom_p[1]), color=self.line_color, thickness=2)
-                cv2.line(frame, (int(cross_p[0]), int(cross_p[1])),
-                         (line_right_bottom_p[0], line_right_bottom_p[1]), color=self.line_color, thickness=2)
-            else:
-                # for i in range(len(line_pixel_right[0])):
-                #     if i < curve_point_count_right :
-                #         cv2.circle(frame, (int(line_pixel_right[0][i]), int(line_pixel_right[1][i])), radius=2, color=self.curve_point_color, thickness=-1)
-                #     if i < curve_point_count_left :
-                #         cv2.circle(frame,  (int(line_pixel_left[0][i]), int(line_pixel_left[1][i])), radius=2, color=self.curve_point_color , thickness=-1)
-                for i in range(self.base_param.screen_h):
-                    if i < line_bottom_y and curve_pixel_left[i] != 0:
-                        cv2.circle(frame,(curve_pixel_left[i],i),radius= 1, color=self.line_color, thickness= -1)
-                        cv2.circle(frame, (curve_pixel_right[i], i), radius=1, color=self.line_color, thickness=-1)
-            cv2.imwrite('/Users/oumingfeng/Documents/lab/HW/world_to_image/test.jpg', frame)
+    def get_objects_in_track(self, steer_angle, obj_pos):
+        """Check whether objects on the ground are between the left and right track line, all objects at once.
 
-        return curve_pixel_left, curve_pixel_right
+        Args:
+            steer_angle: Current steering angle of front wheel.
+            obj_pos: Object positions in vehicle coordinate system, array likes [[x,y,z] ,..., [x,y,z]] or a single
+                [x,y,z]. z is ignored.
+
+        Returns:
+            in_track: Bool array, whether each object is between the two track lines.
+            margin: Float array, the distance (meters) from each object to the nearer track line. It is positive between
+                the lines, negative outside and nan if the object is not in the range of the track lines.
+        """
+        obj_pos = np.asarray(obj_pos, dtype=np.float64).reshape(-1, 3)
+        x = obj_pos[:, 0]
+        y = obj_pos[:, 1]
+        x_start = self.base_param.head_to_back_wheel_d
+        in_range = (x >= x_start) & (x <= self.x_end)
+
+        self.steer_angle = self.steer_angle_rectify(steer_angle)
+        if self.dir == MID:
+            margin = self.base_param.tread / 2.0 - np.abs(y)
+        else:
+            # Both track lines are arcs around the turning center
+            center_y = self.dir * self.base_param.wheelbase * self.cot(self.steer_angle)
+            r_left = math.sqrt(self.get_trajectory_r2(LEFT))
+            r_right = math.sqrt(self.get_trajectory_r2(RIGHT))
+            rho = np.hypot(x, y - center_y)
+            margin = np.minimum(rho - min(r_left, r_right), max(r_left, r_right) - rho)
+            # Only the half circle in front of the rear axle, on the side of the car: dir * (y - center_y) <= 0
+            in_range &= self.dir * (y - center_y) <= 0
+        margin[~in_range] = np.nan
+        in_track = in_range & (margin >= 0)
+        return in_track, margin
+
+    def draw_curve(self, frame, curve_pixel_left, curve_pixel_right, line_bottom_y):
+        """Draw the pixels of curved track lines on the frame, which is used for testing."""
+        for i in range(self.base_param.screen_h):
+            if i < line_bottom_y and curve_pixel_left[i] != 0:
+                cv2.circle(frame, (int(curve_pixel_left[i]), i), radius=1, color=self.line_color, thickness=-1)
+                cv2.circle(frame, (int(curve_pixel_right[i]), i), radius=1, color=self.line_color, thickness=-1)
+
+    def get_straight_world_points(self, side, x_start, x_end, z_pos, tf_matrix):
+        """Sample points on the left or right straight line in the real world.
+
+        Args:
+            side: LEFT or RIGHT.
+            x_start: X coordinate of the nearest point on the line in vehicle coordinate system.
+            x_end: X coordinate of the furthest point on the line in vehicle coordinate system.
+            z_pos: Z coordinate of the line in vehicle coordinate system.
+            tf_matrix: Transform matrix whose shape is 3x4, or stacked transform matrices whose shape is Cx3x4.
+
+        Returns:
+            Homogeneous coordinates [x,y,z,1] of the points, ndarray whose shape is 4xn.
+        """
+        y_pos = side * self.base_param.tread / 2.0
+
+        def get_point(x):
+            ones = np.ones(x.shape[0])
+            zeros = np.zeros(x.shape[0])
+            return np.stack((x, y_pos * ones, z_pos * ones), 0), np.stack((ones, zeros, zeros), 0), \
+                np.zeros((3, x.shape[0]))
+
+        x = sample_by_pixel_tolerance(get_point, x_start, x_end, tf_matrix, self.pixel_tolerance)
+        return np.vstack((get_point(x)[0], np.ones(x.shape[0])))
+
+    def get_curve_world_points(self, side, x_start, x_end, z_pos, tf_matrix):
+        """Sample points on the left or right trajectory circle in the real world, from x_start to x_end or the end of
+        the half circle in front of the rear axle.
+
+        Args:
+            side: LEFT or RIGHT.
+            x_start: X coordinate of the nearest point on the line in vehicle coordinate system.
+            x_end: X coordinate of the furthest point on the line in vehicle coordinate system.
+            z_pos: Z coordinate of the line in vehicle coordinate system.
+            tf_matrix: Transform matrix whose shape is 3x4, or stacked transform matrices whose shape is Cx3x4.
+
+        Returns:
+            Homogeneous coordinates [x,y,z,1] of the points, ndarray whose shape is 4xn.
+        """
+        r = math.sqrt(self.get_trajectory_r2(side))
+        center_y = self.dir * self.base_param.wheelbase * self.cot(self.steer_angle)
+
+        # Trajectory circle x^2 + (y - center_y)^2 = r^2 around the turning center on the rear axle line.
+        # x = r * sin(theta), y = center_y - dir * r * cos(theta), theta in [-pi/2, pi/2] is the half circle in front of
+        # the rear axle on the side of the car.
+        def get_point(theta):
+            sin = np.sin(theta)
+            cos = np.cos(theta)
+            zeros = np.zeros(theta.shape[0])
+            return np.stack((r * sin, center_y - self.dir * r * cos, z_pos + zeros), 0), \
+                np.stack((r * cos, self.dir * r * sin, zeros), 0), \
+                np.stack((-r * sin, self.dir * r * cos, zeros), 0)
+
+        theta = sample_by_pixel_tolerance(get_point, math.asin(min(x_start / r, 1)), math.asin(min(x_end / r, 1)),
+                                          tf_matrix, self.pixel_tolerance)
+        return np.vstack((get_point(theta)[0], np.ones(theta.shape[0])))
+
+    def get_line_bottom_y(self, x_start, y_range, z_pos, base_param):
+        """Get the pixel row of the end of line, which is closed to the bottom of the frame.
+
+        Args:
+            x_start: X coordinate of the nearest point on the line in vehicle coordinate system.
+            y_range: Half of the distance between left and right line.
+            z_pos: Z coordinate of the line in vehicle coordinate system.
+            base_param: BaseParam of the camera.
+
+        Returns:
+            Row index of the bottom end of the line.
+        """
+        bottom_p = np.dot(base_param.tf_matrix, np.array([x_start, y_range, z_pos, 1]))
+        line_bottom_y = int(bottom_p[1] / bottom_p[2])
+        if line_bottom_y > base_param.screen_h:
+            line_bottom_y = base_param.screen_h - 2
+        return line_bottom_y
+
+    def get_plane_homography(self, z_pos, base_param):
+        """Get the homography that maps [x, y, 1] on the plane z = z_pos in vehicle coordinate system to pixel
+        coordinates.
+
+        Args:
+            z_pos: Z coordinate of the plane in vehicle coordinate system.
+            base_param: BaseParam of the camera.
+
+        Returns:
+            homography: ndarray, whose shape is 3x3
+        """
+        tf_matrix = base_param.tf_matrix
+        return np.stack((tf_matrix[:, 0], tf_matrix[:, 1], tf_matrix[:, 2] * z_pos + tf_matrix[:, 3]), 1)
+
+    def get_curve_pixel_by_conic(self, r2, x_start, x_end, z_pos, base_param):
+        """Used for getting the col coordinate of a curved track line in each row by its image conic.
 
-    def get_line_left_x_real_world(self, y):
-        """Used for getting real world x coordinate at vertical distance of the left line
+        The trajectory is a circle on the plane z = z_pos, so its image under the plane homography H is the conic
+        C = H^-T * Cw * H^-1. In each row v, [u, v, 1] C [u, v, 1]^T = 0 is a quadratic equation of u. The roots are
+        mapped back to the real world, and only those on the driven arc between x_start and x_end are kept.
 
         Args:
-            y: Point's vertical distance in the real world, the same as x coordinate in vehicle coordinate system.
+            r2: Square of the trajectory radius.
+            x_start: X coordinate of the nearest point on the line in vehicle coordinate system.
+            x_end: X coordinate of the furthest point on the line in vehicle coordinate system.
+            z_pos: Z coordinate of the line in vehicle coordinate system.
+            base_param: BaseParam of the camera.
 
         Returns:
-            x: float value, the point's horizontal distance in the real world, the same as y coordinate
-            in vehicle coordinate system.
+            A float array whose size is the height of the frame.
+            The i-th value is the col value of the line in the i-th row. If the i-th value is nan, it means that the
+            line doesn't reach the i-th row inside the frame.
         """
-        r2 = math.pow((self.base_param.wheelbase * self.cot(self.steer_angle) - self.dir * self.base_param.tread / 2),
-                      2) \
-             + math.pow((self.base_param.front_wheel_to_head_d + self.base_param.wheelbase), 2)
-        return self.cal_x(r2, y)
-
-    def get_line_right_x_real_world(self, y):
-        """Used for getting real world x coordinate at vertical distance of the right line
-
-          Args:
-              y: Point's vertical distance in the real world, the same as x coordinate in vehicle coordinate system.
-
-          Returns:
-              x: float value, the point's horizontal distance in the real world, the same as y coordinate
-              in vehicle coordinate system.
-          """
-        r2 = math.pow((self.base_param.wheelbase * self.cot(self.steer_angle) + self.dir * self.base_param.tread / 2),
-                      2) \
-             + math.pow((self.base_param.front_wheel_to_head_d + self.base_param.wheelbase), 2)
-        return self.cal_x(r2, y)
-
-    def cal_x(self, r2, y):
-        first = r2 - math.pow(y, 2)
-        # math.pow(wheelbase*cot(steer_angle)+tread/2) - math.pow(y+front_wheel_to_head_d+wheelbase)
-        return (-self.dir) * math.pow(first, 0.5) + self.dir * self.base_param.wheelbase * self.cot(self.steer_angle)
+        # Trajectory circle: x^2 + (y - center_y)^2 = r2
+        center_y = self.dir * self.base_param.wheelbase * self.cot(self.steer_angle)
+        world_conic = np.array([[1.0, 0.0, 0.0],
+                                [0.0, 1.0, -center_y],
+                                [0.0, -center_y, center_y * center_y - r2]])
+        homography = self.get_plane_homography(z_pos, base_param)
+        inv_homography = np.linalg.inv(homography)
+        conic = np.linalg.multi_dot((inv_homography.T, world_conic, inv_homography))
+
+        # a * u^2 + b * u + c = 0 for every row
+        v = np.arange(base_param.screen_h, dtype=np.float64)
+        a = conic[0][0]
+        b = 2 * (conic[0][1] * v + conic[0][2])
+        c = conic[1][1] * v * v + 2 * conic[1][2] * v + conic[2][2]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Numerically stable roots, which also work when a is close to zero
+            q = -0.5 * (b + np.copysign(np.sqrt(b * b - 4 * a * c), b))
+            u = np.stack((q / a, c / q), 0)
+            v = np.broadcast_to(v, u.shape)
+            # Map roots back to the plane
+            world_w = inv_homography[2][0] * u + inv_homography[2][1] * v + inv_homography[2][2]
+            world_x = (inv_homography[0][0] * u + inv_homography[0][1] * v + inv_homography[0][2]) / world_w
+            world_y = (inv_homography[1][0] * u + inv_homography[1][1] * v + inv_homography[1][2]) / world_w
+            # The point must be in front of the camera
+            depth = homography[2][0] * world_x + homography[2][1] * world_y + homography[2][2]
+            valid = np.isfinite(u) & (u >= 0) & (u < base_param.screen_w) & (depth > 0) & \
+                    (world_x >= x_start) & (world_x <= x_end) & (self.dir * (world_y - center_y) <= 0)
+        # Keep the leftmost pixel on the arc, the same as get_curve_scope()
+        u = np.where(valid, u, np.inf).min(axis=0)
+        u[np.isinf(u)] = np.nan
+        return u
+
+    def get_trajectory_r2(self, side):
+        """Get the square of the trajectory radius of the left or right line
+
+        Args:
+            side: LEFT or RIGHT.
+
+        Returns:
+            r2: float value, the square of the radius.
+        """
+        return math.pow((self.base_param.wheelbase * self.cot(self.steer_angle)
+                         - side * self.dir * self.base_param.tread / 2), 2) \
+            + math.pow((self.base_param.front_wheel_to_head_d + self.base_param.wheelbase), 2)
 
     def steer_angle_rectify(self, steer_angle):
         """Rectify the steer angle because steer angle usually has a offset
@@ -219,6 +417,63 @@ class NewTrackLineGenerator:
 
 
 
+class MultiCameraTrackLineGenerator(NewTrackLineGenerator):
+    """This class is used for generate pixel points on the track line for several cameras at once.
+        The track lines are sampled in the real world once for all cameras, and projected to all cameras by one matmul.
+        How to use: An example:
+            multi_base_param = MultiBaseParam(tread, wheelbase, head_height, front_wheel_to_head_d, param_yaml_path)
+            track_line_generator = MultiCameraTrackLineGenerator(multi_base_param)
+            lines = track_line_generator.add_track_lines(0)
+            left_line, right_line = lines[0]
+    Attributes:
+        multi_base_param: A MultiBaseParam class contains the car parameters and the parameters of all cameras.
+        base_param: The BaseParam of the first camera, which is used by add_track_line().
+    """
+    def __init__(self, multi_base_param):
+        super(MultiCameraTrackLineGenerator, self).__init__(multi_base_param.base_params[0])
+        self.multi_base_param = multi_base_param
+
+    def add_track_lines(self, steer_angle):
+        """Used for getting the coordinates of each pixel on track lines for all cameras
+
+        Args:
+            steer_angle: Current steering angle of front wheel.
+
+        Returns:
+            A list of (curve_pixel_left, curve_pixel_right), one for each camera. See add_track_line(). A list is all
+            zero if its line is entirely behind the camera.
+        """
+        x_start = self.base_param.head_to_back_wheel_d
+        x_end = self.x_end
+        y_range = self.base_param.tread / 2.0
+        z_pos = self.base_param.head_height
+
+        self.steer_angle = self.steer_angle_rectify(steer_angle)
+        track_lines = []
+        if self.dir != MID and self.curve_method == CONIC:
+            # Image conics are solved in each camera, there is no world-side work to share
+            for base_param in self.multi_base_param.base_params:
+                track_lines.append(self.get_track_line_by_conic(x_start, x_end, y_range, z_pos, base_param)[:2])
+            return track_lines
+
+        line_left, line_right = self.get_track_line_world_points(x_start, x_end, z_pos,
+                                                                 self.multi_base_param.tf_matrices)
+        # Cx3xn, the left line is followed by the right line
+        line_pixel = self.multi_base_param.multi_cam_param.project(np.hstack((line_left, line_right)))
+        left_num = line_left.shape[1]
+        for base_param, camera_line_pixel in zip(self.multi_base_param.base_params, line_pixel):
+            # Only the part of each line in front of the camera is shown
+            line_pixel_left = clip_line_by_depth(line_left, camera_line_pixel[:, :left_num], base_param.tf_matrix)
+            line_pixel_right = clip_line_by_depth(line_right, camera_line_pixel[:, left_num:], base_param.tf_matrix)
+            if line_pixel_left.shape[1] > 0 and line_pixel_right.shape[1] > 0:
+                track_lines.append(self.get_track_line_pixels(line_pixel_left, line_pixel_right, base_param)[:2])
+            else:
+                # At least one line is entirely behind the camera, the other one is drawn alone
+                track_lines.append((get_single_line_pixels(line_pixel_left, base_param),
+                                    get_single_line_pixels(line_pixel_right, base_param)))
+        return track_lines
+
+
 def cross_point(k1, b1, k2, b2):
     """Calculate intersection function
     Args:
@@ -235,6 +490,119 @@ def cross_point(k1, b1, k2, b2):
     return [x, y]
 
 
+def clip_line_by_depth(line_world, line_pixel, tf_matrix, near_depth=0.1):
+    """Clip a sampled line to the part in front of the camera. The ends crossing the plane depth = near_depth are
+    moved onto the plane by interpolating the world segment, so the line starts where it enters the view.
+    Only the first part in front of the camera is kept if the line enters the view more than once.
+
+    Args:
+        line_world: Homogeneous coordinates [x,y,z,1] of the samples in vehicle coordinate system, ndarray whose shape
+            is 4xn.
+        line_pixel: Projected samples, ndarray whose shape is 3xn. The rows are pixel x, pixel y and depth.
+        tf_matrix: Transform matrix of the camera, whose shape is 3x4.
+        near_depth: Min depth (meters) of the kept part.
+
+    Returns:
+        Projected samples of the kept part, ndarray whose shape is 3xm. m is 0 if the line is behind the camera,
+        otherwise m >= 3.
+    """
+    depth = line_pixel[2]
+    visible = depth >= near_depth
+    if not visible.any():
+        return line_pixel[:, :0]
+    start = int(np.argmax(visible))
+    end = start + int(np.argmin(visible[start:])) if not visible[start:].all() else depth.shape[0]
+
+    def get_crossing(i, j):
+        # Depth is linear in world coordinates, so the crossing point is exact
+        alpha = (near_depth - depth[i]) / (depth[j] - depth[i])
+        return line_world[:, i] + alpha * (line_world[:, j] - line_world[:, i])
+
+    clipped_world = [line_world[:, start:end]]
+    if start > 0:
+        clipped_world.insert(0, get_crossing(start - 1, start).reshape(4, 1))
+    if end < depth.shape[0]:
+        clipped_world.append(get_crossing(end - 1, end).reshape(4, 1))
+    clipped_world = np.hstack(clipped_world)
+    if clipped_world.shape[1] < 3:
+        # fit_line_by_ransac() needs 3 points, the middle point is on the line if the line is straight
+        clipped_world = np.hstack((clipped_world[:, :1], clipped_world.mean(axis=1, keepdims=True),
+                                   clipped_world[:, -1:]))
+    return project_points(tf_matrix, clipped_world)
+
+
+def get_single_line_pixels(line_pixel, base_param):
+    """Used for getting the coordinates of each pixel on one track line, when the other one is not shown.
+
+    Args:
+        line_pixel: Projected samples on the line, ndarray whose shape is 3xn. The rows are pixel x, pixel y and depth.
+        base_param: BaseParam of the camera.
+
+    Returns:
+        A list whose size is the height of the frame. The i-th value is the col value of the pixel of the line in the
+        i-th row. If the i-th value is zero, it means that the line doesn't reach the i-th row.
+    """
+    if line_pixel.shape[1] == 0:
+        return np.zeros(base_param.screen_h, np.int64)
+    curve_pixel = get_curve_scope(line_pixel[:2], base_param.screen_h, base_param.screen_w)
+    # Rows below the nearest point are not on the line
+    line_bottom_y = int(line_pixel[1][0])
+    if line_bottom_y < base_param.screen_h - 1:
+        curve_pixel[max(line_bottom_y, -1) + 1:] = 0
+    return curve_pixel
+
+
+def sample_by_pixel_tolerance(get_point, t_start, t_end, tf_matrix, tolerance, grid_num=256, min_num=3):
+    """Place samples on a parametric curve in the real world, so that the distance between the projected curve and the
+    chords joining the projected samples is about tolerance pixels.
+
+    The chord error of a step h is about |p''| * h^2 / 8, where p'' is the second derivative of the projected curve
+    normal to its tangent, which is obtained from tf_matrix by chain rule. Samples are placed with the density
+    sqrt(|p''| / (8 * tolerance)) along the parameter.
+
+    Args:
+        get_point: Function of the parameter array t, which returns the points on the curve, their first and second
+            derivatives with respect to t. Each is an ndarray whose shape is 3xn.
+        t_start: Parameter of the nearest point.
+        t_end: Parameter of the furthest point.
+        tf_matrix: Transform matrix from real world coordinates to pixel coordinates, whose shape is 3x4. Or stacked
+            transform matrices whose shape is Cx3x4, then the samples meet the tolerance in all cameras.
+        tolerance: Max chord error in pixels.
+        grid_num: Number of parameters used for estimating the sample density.
+        min_num: Min number of samples.
+
+    Returns:
+        Parameters of the samples, increasing from t_start to t_end.
+    """
+    t = np.linspace(t_start, t_end, grid_num)
+    point, d_point, dd_point = get_point(t)
+    # Shape of q is 3xn or Cx3xn
+    q = np.matmul(tf_matrix, np.vstack((point, np.ones(grid_num))))
+    d_q = np.matmul(tf_matrix[..., :3], d_point)
+    dd_q = np.matmul(tf_matrix[..., :3], dd_point)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Derivatives of p = q[:2] / q[2]
+        p = q[..., :2, :] / q[..., 2:3, :]
+        d_p = (d_q[..., :2, :] - p * d_q[..., 2:3, :]) / q[..., 2:3, :]
+        dd_p = (dd_q[..., :2, :] - p * dd_q[..., 2:3, :] - 2 * d_p * d_q[..., 2:3, :]) / q[..., 2:3, :]
+        normal = np.abs(d_p[..., 0, :] * dd_p[..., 1, :] - d_p[..., 1, :] * dd_p[..., 0, :]) / \
+            np.maximum(np.hypot(d_p[..., 0, :], d_p[..., 1, :]), 1e-12)
+        # Points behind the camera are not shown, so they need no samples
+        density = np.where(q[..., 2, :] > 0, np.sqrt(normal / (8.0 * tolerance)), 0)
+    if density.ndim > 1:
+        density = density.max(axis=0)
+    cum_density = np.concatenate(([0], np.cumsum((density[1:] + density[:-1]) / 2 * np.diff(t))))
+    sample_num = max(int(math.ceil(cum_density[-1])) + 1, min_num)
+    if cum_density[-1] < 1:
+        # One chord is close enough, e.g. lines keep straight after projection
+        return np.linspace(t_start, t_end, sample_num)
+    samples = np.interp(np.linspace(0, cum_density[-1], sample_num), cum_density, t)
+    # Keep both ends even if the density is zero around them
+    samples[0] = t_start
+    samples[-1] = t_end
+    return samples
+
+
 def test():
     """
     This function just write for testing.
@@ -288,17 +656,62 @@ def test():
     base_param = BaseParam(tread, wheelbase, head_height, front_wheel_to_head_d, param_yaml_path)
     track_line_generator = NewTrackLineGenerator(base_param)
 
-    vc = cv2.VideoCapture(video_path)
-    rval = vc.isOpened()
-    c = 0
-    while rval:
-        c = c + 1
-        rval, frame = vc.read()
-        if c == 100:
-            result = track_line_generator.add_track_line(0.3, frame)
-            #print(result)
-            break
-    vc.release()
+    video_reader = VideoReader(video_path)
+    frame = video_reader.read_frame(99)
+    if frame is not None:
+        result = track_line_generator.add_track_line(0.3, frame)
+        #print(result)
+    video_reader.release()
+
+
+def test_partly_visible_camera():
+    """
+    This function checks a camera which sees only a part of the track lines, with a synthetic side camera looking
+    forward-left. Going straight, the left line is partly in front of it and the right line is behind it.
+
+    Returns: None
+
+    """
+    import os
+    import tempfile
+    import yaml
+
+    def get_camera(position, yaw, pitch, focal):
+        intrinsics = [focal, focal, 960.0, 540.0]
+        # Vehicle axes (x forward, y left, z up) to camera axes (x right, y down, z forward)
+        axes = np.array([[0, -1, 0], [0, 0, -1], [1, 0, 0]], dtype=np.float64)
+        yaw_matrix = np.array([[math.cos(yaw), -math.sin(yaw), 0], [math.sin(yaw), math.cos(yaw), 0], [0, 0, 1]])
+        pitch_matrix = np.array([[math.cos(pitch), 0, math.sin(pitch)], [0, 1, 0],
+                                 [-math.sin(pitch), 0, math.cos(pitch)]])
+        rotation_matrix = np.dot(axes, np.dot(yaw_matrix, pitch_matrix).T)
+        translation_vec = -np.dot(rotation_matrix, np.array(position, dtype=np.float64))
+        tf_matrix = np.dot(np.array([[focal, 0, 960.0], [0, focal, 540.0], [0, 0, 1]]),
+                           np.hstack((rotation_matrix, translation_vec.reshape(3, 1))))
+        return {'intrinsics': {'data': intrinsics},
+                'resolution': {'width': 1920, 'height': 1080},
+                'translation_veh_cam': {'x': position[0], 'y': position[1], 'z': position[2]},
+                'distortion_coeffs': {'data': [0.0] * 5},
+                'rotation_veh2cam_matrix': {'data': rotation_matrix.ravel().tolist()},
+                'tanslation_veh2cam_matrix': {'data': translation_vec.tolist()},
+                'transform_veh2image_matrix': {'data': tf_matrix.ravel().tolist()},
+                'transform_image2veh_matrix': {'data': np.linalg.inv(np.delete(tf_matrix, 2, axis=1)).ravel().tolist()}}
+
+    fd, param_yaml_path = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as f:
+        yaml.safe_dump({'roof_cam_2': get_camera((1.5, 0, 1.3), 0, 0, 1000.0),
+                        'side_cam': get_camera((3.0, 0, 1.5), 1.25, 0.5, 300.0)}, f)
+    try:
+        multi_base_param = MultiBaseParam(1.832, 2.871, 0.68, 0.89, param_yaml_path, ['roof_cam_2', 'side_cam'])
+    finally:
+        os.remove(param_yaml_path)
+    track_line_generator = MultiCameraTrackLineGenerator(multi_base_param)
+    for steer_angle in [0, 0.1, -0.1]:
+        (left_line, right_line), (side_left_line, side_right_line) = track_line_generator.add_track_lines(steer_angle)
+        assert np.count_nonzero(left_line) > 0 and np.count_nonzero(right_line) > 0
+        assert np.count_nonzero(side_left_line) > 0
+        if steer_angle == 0:
+            # Driving straight, the right line is entirely behind the side camera
+            assert np.count_nonzero(side_right_line) == 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+import os
+import zlib
+import cv2
+import numpy as np
+
+
+class VideoReader:
+    """This class is used for reading arbitrary frames of a video without decoding it from the beginning.
+        An index of frame timestamps and seek points is built by one pass over the video and cached next to it.
+        A seek point is a frame which could be reached exactly by seeking, and other frames are reached by seeking
+        to the nearest seek point before them and decoding forward.
+        How to use: An example:
+            video_reader = VideoReader(video_path)
+            frame = video_reader.read_frame(99)
+            frames = video_reader.read_frames([250, 10, 11, 12])
+            video_reader.release()
+    Attributes:
+        video_path: Video file path.
+        index_path: Path of the cached index file.
+        seek_interval: Distance (frames) between two candidate seek points when building the index.
+        fps: Frame rate of the video.
+        timestamps: Timestamp (milliseconds) of each frame.
+        seek_points: Sorted frame indexes which could be reached exactly by seeking.
+        frame_count: Number of frames in the video.
+    """
+    def __init__(self, video_path, seek_interval=30, use_cache=True):
+        self.video_path = video_path
+        self.index_path = video_path + '.index.npz'
+        self.seek_interval = seek_interval
+        self.vc = cv2.VideoCapture(video_path)
+        if not self.vc.isOpened():
+            raise IOError('Cannot open video: ' + video_path)
+        self.fps = self.vc.get(cv2.CAP_PROP_FPS)
+        # Index of the frame which would be returned by the next vc.read()
+        self.pos = 0
+        self.timestamps = None
+        self.seek_points = None
+        if not (use_cache and self.load_index()):
+            self.build_index()
+            if use_cache:
+                self.save_index()
+        self.frame_count = len(self.timestamps)
+
+    def read_frame(self, index):
+        """Read one frame.
+
+        Args:
+            index: Frame index, starting from 0.
+
+        Returns:
+            frame: Frame image array, or None if the index is out of range.
+        """
+        return self.read_frames([index])[0]
+
+    def read_frames(self, indexes):
+        """Read a batch of frames. Requests are sorted and deduplicated, so that each frame is decoded at most once
+        and nearby requests share the forward decoding.
+
+        Args:
+            indexes: Frame indexes, starting from 0.
+
+        Returns:
+            frames: A list of frame image arrays in the same order of indexes. The frame is None if its index is out
+                of range.
+        """
+        frames = {}
+        for index in sorted(set(indexes)):
+            if index < 0 or index >= self.frame_count:
+                frames[index] = None
+                continue
+            # Seek only if there is a seek point between the current position and the target, otherwise decoding
+            # forward is never slower.
+            seek_point = self.get_seek_point(index)
+            if seek_point > self.pos or index < self.pos:
+                self.seek(seek_point)
+            # Frames before the target are only decoded, without being retrieved
+            rval = True
+            while rval and self.pos < index:
+                rval = self.vc.grab()
+                self.pos += 1
+            frame = None
+            if rval:
+                rval, frame = self.vc.read()
+                self.pos += 1
+            frames[index] = frame if rval else None
+        return [frames[index] for index in indexes]
+
+    def get_frame_index(self, msec):
+        """Get the index of the frame shown at the timestamp.
+
+        Args:
+            msec: Timestamp in milliseconds.
+
+        Returns:
+            index: The index of the last frame whose timestamp is not later than msec.
+        """
+        index = np.searchsorted(self.timestamps, msec, side='right') - 1
+        return int(max(index, 0))
+
+    def get_seek_point(self, index):
+        """Get the nearest seek point which is not after the frame index."""
+        return int(self.seek_points[np.searchsorted(self.seek_points, index, side='right') - 1])
+
+    def seek(self, index):
+        """Move to the seek point so that the next decoded frame is the index-th frame."""
+        if index == 0:
+            # Reopening is the only seek which is exact for all backends
+            self.vc.release()
+            self.vc = cv2.VideoCapture(self.video_path)
+        else:
+            self.vc.set(cv2.CAP_PROP_POS_FRAMES, index)
+        self.pos = index
+
+    def build_index(self):
+        """Decode the whole video once to record frame timestamps, then keep the candidate seek points whose frame
+        after seeking is the same as the one decoded sequentially.
+        """
+        timestamps = []
+        fingerprints = {}
+        self.seek(0)
+        while True:
+            rval, frame = self.vc.read()
+            if not rval:
+                break
+            timestamps.append(self.vc.get(cv2.CAP_PROP_POS_MSEC))
+            if self.pos % self.seek_interval == 0:
+                fingerprints[self.pos] = get_fingerprint(frame)
+            self.pos += 1
+
+        seek_points = [0]
+        for index in sorted(fingerprints):
+            if index == 0:
+                continue
+            self.seek(index)
+            rval, frame = self.vc.read()
+            self.pos += 1
+            if rval and get_fingerprint(frame) == fingerprints[index]:
+                seek_points.append(index)
+        self.timestamps = np.array(timestamps, dtype=np.float64)
+        self.seek_points = np.array(seek_points, dtype=np.int64)
+
+    def load_index(self):
+        """Load the cached index if it was built with the same video file and seek interval.
+
+        Returns:
+            True if the index is loaded.
+        """
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with np.load(self.index_path) as index:
+                if list(index['video_stat']) != get_video_stat(self.video_path) or \
+                        int(index['seek_interval']) != self.seek_interval:
+                    return False
+                self.timestamps = index['timestamps']
+                self.seek_points = index['seek_points']
+        except Exception:
+            # A truncated or corrupt index is rebuilt
+            return False
+        return True
+
+    def save_index(self):
+        """Save the index next to the video. Nothing is saved if the folder is not writable."""
+        video_stat = np.array(get_video_stat(self.video_path), dtype=np.int64)
+        try:
+            # Pass a file object, otherwise numpy appends another '.npz' to the path
+            with open(self.index_path, 'wb') as f:
+                np.savez(f, timestamps=self.timestamps, seek_points=self.seek_points, video_stat=video_stat,
+                         seek_interval=self.seek_interval)
+        except OSError:
+            pass
+
+    def release(self):
+        self.vc.release()
+
+
+def get_fingerprint(frame):
+    """Checksum of a frame, which is used for checking whether seeking reaches the expected frame."""
+    return zlib.crc32(np.ascontiguousarray(frame).tobytes())
+
+
+def get_video_stat(video_path):
+    """Size and modified time of the video file, which are used for invalidating the cached index."""
+    stat = os.stat(video_path)
+    return [stat.st_size, stat.st_mtime_ns]
@@ -16,11 +16,15 @@ class BaseParam:
         front_wheel_to_head_d: Distance between front wheel center and car head
         param_yaml_path: Yaml file path for camera configuration.
         tf_matrix: Transform matrix that could convert real world coordinates to image plane's pixel coordinates.
+        camera_name: Name of the camera in the yaml file.
     """
-    def __init__(self, tread,wheelbase,head_height,front_wheel_to_head_d,param_yaml_path):
+    def __init__(self, tread,wheelbase,head_height,front_wheel_to_head_d,param_yaml_path, camera_name='roof_cam_2',
+                 cam_param=None):
         self.alpha = 0
         self.beta = 0
-        self.cam_param = CameraParam(param_yaml_path)
+        self.camera_name = camera_name
+        # The camera is loaded from the yaml file if cam_param is not given
+        self.cam_param = cam_param if cam_param is not None else CameraParam(param_yaml_path, camera_name)
         self.screen_w = self.cam_param.resolution['width']
         self.screen_h = self.cam_param.resolution['height']
         self.camera_h = self.cam_param.cam_cord['z']
@@ -33,23 +37,79 @@ class BaseParam:
         self.camera_to_head_d = front_wheel_to_head_d
 
 
-class CameraParam:
-    def __init__(self, param_yaml_path):
+class MultiBaseParam:
+    """A class contains the car parameters and the parameters of several cameras on the car.
+
+    Attributes:
+        base_params: A list of BaseParam, one for each camera.
+        multi_cam_param: A MultiCameraParam class contains the parameters of all cameras.
+        tf_matrices: Stacked transform matrices of all cameras, ndarray whose shape is Cx3x4.
+    """
+    def __init__(self, tread, wheelbase, head_height, front_wheel_to_head_d, param_yaml_path, camera_names=None):
+        self.multi_cam_param = MultiCameraParam(param_yaml_path, camera_names)
+        self.base_params = [BaseParam(tread, wheelbase, head_height, front_wheel_to_head_d, param_yaml_path, name,
+                                      cam_param)
+                            for name, cam_param in zip(self.multi_cam_param.camera_names,
+                                                       self.multi_cam_param.cam_params)]
+        self.tf_matrices = self.multi_cam_param.tf_matrices
+
+
+class MultiCameraParam:
+    """A class contains the parameters of several cameras in one yaml file.
+
+    Attributes:
+        camera_names: Names of the cameras in the yaml file. By default, every top-level entry which has a
+            transform_veh2image_matrix is a camera, and other entries are ignored.
+        cam_params: A list of CameraParam, one for each camera.
+        tf_matrices: Stacked transform_veh2image_matrix of all cameras, ndarray whose shape is Cx3x4.
+    """
+    def __init__(self, param_yaml_path, camera_names=None):
         with open(param_yaml_path) as f:
             para_dic = yaml.load(f, Loader=yaml.FullLoader)
-            para_dic = para_dic['roof_cam_2']
-            self.intrinsics = convert_to_intrinsics_matrix(para_dic['intrinsics']['data'])
-            self.resolution = para_dic['resolution']
-            self.cam_cord = para_dic['translation_veh_cam']
-            self.distortion_coeffs = np.array(para_dic['distortion_coeffs']['data'])
-            rotation_matrix = np.array(para_dic['rotation_veh2cam_matrix']['data'])
-            self.rotation_matrix = np.reshape(rotation_matrix, (3, 3))
-            translation_vec = np.array(para_dic['tanslation_veh2cam_matrix']['data'])
-            self.translation_vec = np.reshape(translation_vec, (3, 1))
-            transform_veh2image_matrix = np.array(para_dic['transform_veh2image_matrix']['data'])
-            self.transform_veh2image_matrix = np.reshape(transform_veh2image_matrix, (3, 4))
-            transform_image2veh_matrix = np.array(para_dic['transform_image2veh_matrix']['data'])
-            self.transform_image2veh_matrix = np.reshape(transform_image2veh_matrix, (3, 3))
+        if camera_names is None:
+            camera_names = [name for name, value in para_dic.items()
+                            if isinstance(value, dict) and 'transform_veh2image_matrix' in value]
+        self.camera_names = list(camera_names)
+        self.cam_params = [CameraParam(param_yaml_path, name, para_dic) for name in self.camera_names]
+        self.tf_matrices = np.stack([cam_param.transform_veh2image_matrix for cam_param in self.cam_params], 0)
+
+    def project(self, points):
+        """Project points in vehicle coordinate system to all cameras by one matmul.
+
+        Args:
+            points: Homogeneous coordinates [x,y,z,1] of points, ndarray whose shape is 4xn.
+
+        Returns:
+            ndarray whose shape is Cx3xn. The rows are pixel x, pixel y and depth.
+        """
+        return project_points(self.tf_matrices, points)
+
+
+class CameraParam:
+    """A class contains the parameters of one camera.
+
+    Args:
+        param_yaml_path: Yaml file path for camera configuration.
+        camera_name: Name of the camera in the yaml file.
+        para_dic: Parsed content of the yaml file. The file is not read again if it is given.
+    """
+    def __init__(self, param_yaml_path, camera_name='roof_cam_2', para_dic=None):
+        if para_dic is None:
+            with open(param_yaml_path) as f:
+                para_dic = yaml.load(f, Loader=yaml.FullLoader)
+        para_dic = para_dic[camera_name]
+        self.intrinsics = convert_to_intrinsics_matrix(para_dic['intrinsics']['data'])
+        self.resolution = para_dic['resolution']
+        self.cam_cord = para_dic['translation_veh_cam']
+        self.distortion_coeffs = np.array(para_dic['distortion_coeffs']['data'])
+        rotation_matrix = np.array(para_dic['rotation_veh2cam_matrix']['data'])
+        self.rotation_matrix = np.reshape(rotation_matrix, (3, 3))
+        translation_vec = np.array(para_dic['tanslation_veh2cam_matrix']['data'])
+        self.translation_vec = np.reshape(translation_vec, (3, 1))
+        transform_veh2image_matrix = np.array(para_dic['transform_veh2image_matrix']['data'])
+        self.transform_veh2image_matrix = np.reshape(transform_veh2image_matrix, (3, 4))
+        transform_image2veh_matrix = np.array(para_dic['transform_image2veh_matrix']['data'])
+        self.transform_image2veh_matrix = np.reshape(transform_image2veh_matrix, (3, 3))
 
     def get_tf_matrix(self):
         """
@@ -72,6 +132,21 @@ class CameraParam:
         return  np.linalg.pinv(tf_matrix)
 
 
+def project_points(tf_matrix, points):
+    """Project points in vehicle coordinate system to pixel coordinates of one or several cameras.
+
+    Args:
+        tf_matrix: Transform matrix whose shape is 3x4, or stacked transform matrices whose shape is Cx3x4.
+        points: Homogeneous coordinates [x,y,z,1] of points, ndarray whose shape is 4xn.
+
+    Returns:
+        ndarray whose shape is 3xn or Cx3xn. The rows are pixel x, pixel y and depth.
+    """
+    pixel = np.matmul(tf_matrix, points)
+    pixel[..., :2, :] = pixel[..., :2, :] / pixel[..., 2:3, :]
+    return pixel
+
+
 def convert_to_intrinsics_matrix(intrinsics):
     # intrinsics 1x4
     intrinsics_matrix = np.array([[intrinsics[0], 0, intrinsics[2]],[0, intrinsics[1], intrinsics[3]],[0, 0, 1]])